@@ -1,8 +1,18 @@
 import sys
 import os
+import re
+import csv
+import json
+import bisect
+import shlex
+import operator
 import datetime
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from argparse import ArgumentParser
-from typing import Tuple
+from typing import Tuple, NamedTuple, Callable, Optional
 
 import serial
 import psycopg2
@@ -24,6 +34,8 @@ db_connection = None
 DEFAULT_LOG_PATH = 'log'
 DEFAULT_ENV_FILE = '.env'
 DEFAULT_ENV_PATH = '.'
+DEFAULT_STATE_PATH = 'state'
+DEFAULT_ENERGY_MAX_GAP = 900
 
 ap = ArgumentParser(description='Query connected inverters',)
 ap.add_argument('--list', action='store_true')
@@ -36,7 +48,20 @@ ap.add_argument('--print', action='store_true')
 ap.add_argument('--log', action='store_true')
 ap.add_argument('--ignore-length-error', action='store_true')
 ap.add_argument('--include-metadata', action='store_true')
+ap.add_argument('--alerts', action='store_true')
+ap.add_argument('--energy', action='store_true')
 ap.add_argument('--log-path', default=DEFAULT_LOG_PATH)
+ap.add_argument('--state-path', default=DEFAULT_STATE_PATH)
+ap.add_argument('--import-logs', default=None)
+ap.add_argument('--import-workers', type=int, default=os.cpu_count())
+ap.add_argument('--read-logs', choices=['sense', 'status', 'setup', 'energy'], default=None)
+ap.add_argument('--from', dest='read_from', default=None)
+ap.add_argument('--to', dest='read_to', default=None)
+ap.add_argument('--source', default=None)
+ap.add_argument('--fields', default=None)
+ap.add_argument('--export', choices=['csv', 'parquet'], default=None)
+ap.add_argument('--export-file', default=None)
+ap.add_argument('--apply-setup', default=None)
 ap.add_argument('--env', default=DEFAULT_ENV_FILE)
 ap.add_argument('--env-path', default=DEFAULT_ENV_PATH)
 args = ap.parse_args()
@@ -53,6 +78,26 @@ LIST_SEPARATOR = config['LIST_SEPARATOR']
 SENSE_LOG_FILE_MASK = f'sense-{timestamp_string}.log'
 STATUS_LOG_FILE_MASK = f'status-{timestamp_string}.log'
 SETUP_LOG_FILE_MASK = f'setup-{timestamp_string}.log'
+ENERGY_LOG_FILE_MASK = f'energy-{timestamp_string}.log'
+ALERT_STATE_FILE = 'alerts.json'
+ENERGY_STATE_FILE = 'energy.json'
+SETUP_STATE_FILE = 'setup.json'
+ENERGY_MAX_GAP = DEFAULT_ENERGY_MAX_GAP
+
+
+def load_state(unc: str) -> dict:
+    if os.path.isfile(unc):
+        with open(unc, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(unc: str, state: dict):
+    # Write aside and swap in, a run killed mid-write must not leave a truncated state file
+    with open(f'{unc}.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(f'{unc}.tmp', unc)
+
 
 if args.list:
     # args.list
@@ -62,6 +107,64 @@ if args.list:
     args.setup = False
     args.print = False
     args.log = False
+    args.alerts = False
+    args.energy = False
+    args.apply_setup = None
+if args.apply_setup:
+    args.basic = False
+    args.sense = False
+    args.status = False
+    args.setup = False
+    args.alerts = False
+    args.energy = False
+    args.read_logs = None
+    args.import_logs = None
+    if not os.path.isfile(args.apply_setup):
+        raise FileNotFoundError(f'{args.apply_setup}')
+if args.read_logs:
+    args.basic = False
+    args.sense = False
+    args.status = False
+    args.setup = False
+    args.alerts = False
+    args.energy = False
+    args.import_logs = None
+    args.database = False
+    args.log_path = os.path.abspath(args.log_path)
+    if not os.path.isdir(args.log_path):
+        raise PathDoesNotExistError(f'{args.log_path}')
+    if args.export == 'parquet' and not args.export_file:
+        ap.error('--export parquet requires --export-file')
+if args.import_logs:
+    args.basic = False
+    args.sense = False
+    args.status = False
+    args.setup = False
+    args.alerts = False
+    args.energy = False
+    args.database = True
+    if args.import_workers < 1:
+        ap.error('--import-workers must be at least 1')
+    args.import_logs = os.path.abspath(args.import_logs)
+    if os.path.isfile(args.import_logs):
+        raise NotADirectoryError(f'{args.import_logs}')
+    if not os.path.isdir(args.import_logs):
+        raise PathDoesNotExistError(f'{args.import_logs}')
+if args.alerts or args.energy:
+    args.status = True
+if args.energy:
+    try:
+        ENERGY_MAX_GAP = float(config.get('ENERGY_MAX_GAP') or DEFAULT_ENERGY_MAX_GAP)
+    except ValueError:
+        ap.error(f'ENERGY_MAX_GAP "{config.get("ENERGY_MAX_GAP")}" is not a number')
+    if ENERGY_MAX_GAP <= 0:
+        ap.error('ENERGY_MAX_GAP must be greater than 0')
+if args.alerts or args.energy or args.apply_setup:
+    args.state_path = os.path.abspath(args.state_path)
+    if os.path.isfile(args.state_path):
+        raise NotADirectoryError(f'{args.state_path}')
+    if not os.path.isdir(args.state_path):
+        raise PathDoesNotExistError(f'{args.state_path}')
 if args.log:
     args.log_path = os.path.abspath(args.log_path)
     if os.path.isfile(args.log_path):
@@ -110,6 +213,10 @@ class Inverters:
         """Raised when bytes read does not agree with the result length"""
         pass
 
+    class SetupValueError(Exception):
+        """Raised when a setup value can not be encoded into its register"""
+        pass
+
     @staticmethod
     def list_ports():
         """
@@ -292,6 +399,28 @@ class EP2000(serial.Serial):
     0A 10  7D 02  00  01  02 00  01 B8 45
     """
 
+    # Setup registers in READ_SETUP/WRITE_SETUP order: enumeration (decoded by name) or scale factor
+    SETUP_ENCODING = {
+        'GridFrequencyType': EP2000Enums.GRID_FREQUENCY_TYPE,
+        'GridVoltageType': 1,
+        'BatteryLowVoltage': 0.1,
+        'ConstantChargeVoltage': 0.1,
+        'FloatChargeVoltage': 0.1,
+        'BulkChargeCurrent': 1,
+        'BuzzerSilence': EP2000Enums.EP_BUZZER_SILENCE,
+        'EnableGridCharge': EP2000Enums.STATE_INVERTED,
+        'EnableKeySound': EP2000Enums.STATE_INVERTED,
+        'EnableBacklight': EP2000Enums.STATE,
+    }
+    # Accepted setup values in decoded units, checked before anything is written
+    SETUP_RANGE = {
+        'GridVoltageType': (100, 240),
+        'BatteryLowVoltage': (10.0, 64.0),
+        'ConstantChargeVoltage': (10.0, 64.0),
+        'FloatChargeVoltage': (10.0, 64.0),
+        'BulkChargeCurrent': (0, 100),
+    }
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.index = self.INDEX
@@ -476,6 +605,63 @@ class EP2000(serial.Serial):
         report['EnableBacklight'] = (index, data[index], EP2000Enums.STATE.get(data[index], 'N/A'), '')
         return report
 
+    @staticmethod
+    def setup_registers(report: dict) -> Optional[list]:
+        if 'error' in report:
+            return None
+        return [report[key][1] for key in EP2000.SETUP_ENCODING]
+
+    @staticmethod
+    def encode_setup(key: str, value: str) -> int:
+        encoding = EP2000.SETUP_ENCODING[key]
+        if value is None:
+            raise Inverters.SetupValueError(f'{key}: no value given')
+        if isinstance(encoding, dict):
+            for raw, name in encoding.items():
+                if name == value.strip().upper():
+                    return raw
+            raise Inverters.SetupValueError(f'{key}: "{value}" not one of {list(encoding.values())}')
+        try:
+            number = float(value)
+        except ValueError:
+            raise Inverters.SetupValueError(f'{key}: "{value}" is not a number')
+        if key in EP2000.SETUP_RANGE:
+            minimum, maximum = EP2000.SETUP_RANGE[key]
+            if not minimum <= number <= maximum:
+                raise Inverters.SetupValueError(f'{key}: "{value}" outside {minimum} to {maximum}')
+        raw = int(round(number / encoding))
+        if not 0 <= raw <= 0xFFFF:
+            raise Inverters.SetupValueError(f'{key}: "{value}" out of register range')
+        return raw
+
+    def write_setup(self, registers: list) -> bytes:
+        command_string, _ = EP2000.WRITE_SETUP
+        out_buffer = bytes.fromhex(command_string) + b''.join(
+            [register.to_bytes(2, byteorder=BYTE_ORDER) for register in registers]
+        )
+        out_buffer += self._crc(out_buffer)
+        # Write multiple registers echoes address, function, start register, register count and CRC
+        in_buffer = self._send((out_buffer.hex(' '), 8))
+        if len(in_buffer) == 7 and in_buffer[0] == 0x10:
+            # Autocorrection of missing handshake byte. Expected 0A 10 79 18, received 10 79 18. Adding 0A.
+            in_buffer = b'\x0A' + in_buffer[0:]
+        if in_buffer[:6] != out_buffer[:6]:
+            raise Inverters.SerialWriteException(f'Setup write rejected ({in_buffer.hex(" ").upper()})')
+        return in_buffer
+
+    @staticmethod
+    def _crc(out_buffer: bytes) -> bytes:
+        """
+        CRC-16/MODBUS (polynomial A001, initial FFFF), low byte first. Same algorithm as the CRCCheck
+        in _valid_crc and the CRC bytes of the fixed commands above, e.g. 0A 03 79 18 00 07 -> 9C 28.
+        """
+        crc = 0xFFFF
+        for byte in out_buffer:
+            crc ^= byte
+            for _ in range(8):
+                crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        return crc.to_bytes(2, byteorder='little')
+
     def _send(self, command: Tuple[str, int], ignore_length_error: bool = False) -> bytes:
         command_string, result_length = command
         out_buffer = bytes.fromhex(command_string)
@@ -586,6 +772,630 @@ class EP2000(serial.Serial):
         return in_buffer[_open:_close]
 
 
+class AlertRule(NamedTuple):
+    name: str
+    field: str
+    compare: Callable
+    threshold: float
+    clear: float
+    debounce: float
+    cooldown: float
+
+
+class AlertRules:
+    """
+    Rules are declared in the .env file over the decoded status field names:
+
+    ALERT_RULES="LoadHigh,BatteryLow,Fault"
+    ALERT_LoadHigh="LoadPercent > 90 clear 85 for 60 cooldown 600"
+    ALERT_BatteryLow="BatteryCapacity < 20 clear 25"
+    ALERT_Fault="Fault != 0"
+
+    <field> <operator> <threshold> [clear <value>] [for <seconds>] [cooldown <seconds>]
+    """
+
+    OPERATORS = {
+        '>': operator.gt,
+        '>=': operator.ge,
+        '<': operator.lt,
+        '<=': operator.le,
+        '==': operator.eq,
+        '!=': operator.ne,
+    }
+    OPTIONS = {
+        'clear': 'clear',
+        'for': 'debounce',
+        'cooldown': 'cooldown',
+    }
+    FIRING = 'FIRING'
+    RESOLVED = 'RESOLVED'
+    HOOK_ERROR = 'HOOK_ERROR'
+    # Decoded status field names, taken from the translation itself so they can not drift
+    STATUS_FIELDS = list(EP2000._translate_status(bytes(54), {}))
+
+    class RuleSyntaxError(Exception):
+        """Raised when an alert rule in the configuration can not be parsed"""
+        pass
+
+    def __init__(self, config: dict, state_unc: str):
+        self.command = config.get('ALERT_COMMAND')
+        self.log_unc = config.get('ALERT_LOG_FILE')
+        self.state_unc = state_unc
+        self.rules = {}
+        names = [name.strip() for name in (config.get('ALERT_RULES') or '').split(LIST_SEPARATOR)]
+        for name in [name for name in names if name]:
+            rule = self.compile(name, config.get(f'ALERT_{name}') or '')
+            self.rules.setdefault(rule.field, []).append(rule)
+        self.state = load_state(self.state_unc)
+
+    @staticmethod
+    def compile(name: str, expression: str) -> AlertRule:
+        tokens = expression.split()
+        if len(tokens) < 3 or len(tokens) % 2 == 0:
+            raise AlertRules.RuleSyntaxError(f'{name}: "{expression}"')
+        field, _operator, threshold = tokens[:3]
+        if field not in AlertRules.STATUS_FIELDS:
+            raise AlertRules.RuleSyntaxError(f'{name}: unknown status field "{field}"')
+        if _operator not in AlertRules.OPERATORS:
+            raise AlertRules.RuleSyntaxError(f'{name}: unknown operator "{_operator}"')
+        threshold = AlertRules._number(name, 'threshold', threshold)
+        options = {'clear': None, 'debounce': 0.0, 'cooldown': 0.0}
+        for key, value in zip(tokens[3::2], tokens[4::2]):
+            if key not in AlertRules.OPTIONS:
+                raise AlertRules.RuleSyntaxError(f'{name}: unknown option "{key}"')
+            options[AlertRules.OPTIONS[key]] = AlertRules._number(name, key, value)
+        clear = threshold if options['clear'] is None else options['clear']
+        if _operator in ('>', '>=') and clear > threshold:
+            raise AlertRules.RuleSyntaxError(f'{name}: clear {clear} must not be above threshold {threshold}')
+        if _operator in ('<', '<=') and clear < threshold:
+            raise AlertRules.RuleSyntaxError(f'{name}: clear {clear} must not be below threshold {threshold}')
+        return AlertRule(
+            name=name,
+            field=field,
+            compare=AlertRules.OPERATORS[_operator],
+            threshold=threshold,
+            clear=clear,
+            debounce=options['debounce'],
+            cooldown=options['cooldown'],
+        )
+
+    @staticmethod
+    def _number(name: str, key: str, value: str) -> float:
+        try:
+            return float(value)
+        except ValueError:
+            raise AlertRules.RuleSyntaxError(f'{name}: {key} "{value}" is not a number')
+
+    def evaluate(self, source: str, report: dict, now: float) -> list:
+        """
+        Costs one comparison per configured rule for every report. Each rule keeps its own
+        pending/active/last fired state per source so a single report is enough to advance it.
+        """
+        events = []
+        states = self.state.setdefault(source, {})
+        for field, rules in self.rules.items():
+            if field not in report:
+                continue
+            _index, _raw, _value, _unit = report[field]
+            value = _value if isinstance(_value, (int, float)) else _raw
+            for rule in rules:
+                state = states.setdefault(rule.name, {'active': False, 'pending_since': None, 'last_fired': None})
+                if state['active']:
+                    if not rule.compare(value, rule.clear):
+                        state['active'] = False
+                        events.append((rule, AlertRules.RESOLVED, value))
+                    continue
+                if not rule.compare(value, rule.threshold):
+                    state['pending_since'] = None
+                    continue
+                if state['pending_since'] is None:
+                    state['pending_since'] = now
+                if now - state['pending_since'] < rule.debounce:
+                    continue
+                if state['last_fired'] is not None and now - state['last_fired'] < rule.cooldown:
+                    continue
+                state['active'] = True
+                state['pending_since'] = None
+                state['last_fired'] = now
+                events.append((rule, AlertRules.FIRING, value))
+        if events:
+            # Persist active/last fired before dispatching, a later failure in this run must not re-fire them
+            self.save()
+        for rule, kind, value in events:
+            self._dispatch(source, rule, kind, value, now)
+        return events
+
+    def _dispatch(self, source: str, rule: AlertRule, kind: str, value, now: float):
+        self._log([f'{now}', f'{source}', rule.name, kind, f'{rule.field}:{value}'])
+        if self.command:
+            environment = dict(os.environ)
+            environment.update({
+                'ALERT_NAME': rule.name,
+                'ALERT_STATE': kind,
+                'ALERT_SOURCE': f'{source}',
+                'ALERT_FIELD': rule.field,
+                'ALERT_VALUE': f'{value}',
+                'ALERT_TIMESTAMP': f'{now}',
+            })
+            try:
+                # Fire and forget, the hook must never hold up or abort the poll
+                subprocess.Popen(
+                    shlex.split(self.command), env=environment, start_new_session=True,
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                )
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                self._log([f'{now}', f'{source}', rule.name, AlertRules.HOOK_ERROR, f'{e}'])
+
+    def _log(self, buffer: list):
+        if self.log_unc:
+            with open(self.log_unc, 'a') as f:
+                f.write(COLUMN_SEPARATOR.join(buffer))
+                f.write(NEWLINE)
+        else:
+            print(COLUMN_SEPARATOR.join(buffer), file=sys.stderr)
+
+    def save(self):
+        save_state(self.state_unc, self.state)
+
+
+class EnergyCounters:
+    """
+    Daily counters integrated with the trapezoidal rule between consecutive status samples.
+    The interval from the previous sample is attributed to the WorkState held at its start,
+    intervals longer than the maximum gap are not integrated but counted as GapTime, and the
+    interval that crosses midnight is credited to the new day.
+    """
+
+    TABLE = (
+        'CREATE TABLE IF NOT EXISTS incoming_energy ('
+        'unixtime double precision, source text, data text)'
+    )
+    GRID_STATES = ('LINE', 'GRID_CHG')
+    BATTERY_STATES = ('BACKUP',)
+    COUNTERS = {
+        'LoadEnergy': 'kWh',
+        'BatteryChargedCapacity': 'Ah',
+        'BatteryDischargedCapacity': 'Ah',
+        'BatteryChargedEnergy': 'kWh',
+        'BatteryDischargedEnergy': 'kWh',
+        'GridTime': 's',
+        'BatteryTime': 's',
+        'OtherTime': 's',
+        'GapTime': 's',
+    }
+
+    def __init__(self, state_unc: str, max_gap: float):
+        self.state_unc = state_unc
+        self.max_gap = max_gap
+        self.state = load_state(self.state_unc)
+
+    def update(self, source: str, report: dict, now: float) -> dict:
+        for key in ('WorkState', 'LoadPower', 'BatteryVoltage', 'BatteryCurrent'):
+            if key not in report:
+                return {}
+        sample = {
+            'timestamp': now,
+            'WorkState': report['WorkState'][2],
+            'LoadPower': report['LoadPower'][2],
+            'BatteryCurrent': report['BatteryCurrent'][2],
+            'BatteryPower': report['BatteryCurrent'][2] * report['BatteryVoltage'][2],
+        }
+        day = datetime.datetime.fromtimestamp(now).strftime('%Y%m%d')
+        state = self.state.setdefault(source, {'day': day, 'sample': None, 'counters': {}})
+        if state['day'] != day:
+            state['day'] = day
+            state['counters'] = {}
+        counters = state['counters']
+        for key in EnergyCounters.COUNTERS:
+            counters.setdefault(key, 0.0)
+        previous = state['sample']
+        if previous is not None:
+            self._integrate(previous, sample, counters)
+        state['sample'] = sample
+        return {
+            key: (round(counters[key], 3), unit)
+            for key, unit in EnergyCounters.COUNTERS.items()
+        }
+
+    def _integrate(self, previous: dict, sample: dict, counters: dict):
+        elapsed = sample['timestamp'] - previous['timestamp']
+        if elapsed <= 0:
+            return
+        if elapsed > self.max_gap:
+            counters['GapTime'] += elapsed
+            return
+        hours = elapsed / 3600
+        counters['LoadEnergy'] += (previous['LoadPower'] + sample['LoadPower']) / 2 * hours / 1000
+        charge = (previous['BatteryCurrent'] + sample['BatteryCurrent']) / 2 * hours
+        energy = (previous['BatteryPower'] + sample['BatteryPower']) / 2 * hours / 1000
+        if previous['WorkState'] in EnergyCounters.GRID_STATES:
+            counters['GridTime'] += elapsed
+            counters['BatteryChargedCapacity'] += charge
+            counters['BatteryChargedEnergy'] += energy
+        elif previous['WorkState'] in EnergyCounters.BATTERY_STATES:
+            counters['BatteryTime'] += elapsed
+            counters['BatteryDischargedCapacity'] += charge
+            counters['BatteryDischargedEnergy'] += energy
+        else:
+            counters['OtherTime'] += elapsed
+
+    def save(self):
+        save_state(self.state_unc, self.state)
+
+
+class LogImporter:
+    """
+    Bulk load of the daily sense/status/setup/energy log files through COPY. Every file is
+    streamed from its last checkpointed byte position and the checkpoint is advanced in the
+    same transaction as the COPY, so files can be imported again (or while still growing)
+    without duplicating rows. Status files also populate incoming_basic.
+    """
+
+    FILE_PATTERN = re.compile(r'^(sense|status|setup|energy)-(\d{8})\.log$')
+    META_DATA = ('hex-string', 'Model')
+    CHECKPOINT_TABLE = (
+        'CREATE TABLE IF NOT EXISTS import_checkpoint ('
+        'filename text PRIMARY KEY, position bigint NOT NULL, rows bigint NOT NULL, imported double precision)'
+    )
+
+    class CopyStream:
+        """File like wrapper that lets COPY pull rows from a generator"""
+
+        def __init__(self, rows):
+            self.rows = rows
+            self.buffer = ''
+
+        def read(self, size=-1):
+            chunks = [self.buffer]
+            length = len(self.buffer)
+            for row in self.rows:
+                chunks.append(row)
+                length += len(row)
+                if 0 <= size <= length:
+                    break
+            buffer = ''.join(chunks)
+            if size < 0:
+                size = len(buffer)
+            self.buffer = buffer[size:]
+            return buffer[:size]
+
+    @staticmethod
+    def run(path: str, workers: int):
+        units = {}
+        for name in sorted(os.listdir(path)):
+            if LogImporter.FILE_PATTERN.match(name):
+                unc = os.path.join(path, name)
+                units[unc] = os.path.getsize(unc)
+        _cursor = db_connection.cursor()
+        _cursor.execute(LogImporter.CHECKPOINT_TABLE)
+        _cursor.execute(EnergyCounters.TABLE)
+        _cursor.execute('SELECT filename, position FROM import_checkpoint')
+        checkpoints = dict(_cursor.fetchall())
+        db_connection.commit()
+        pending = [unc for unc, size in units.items() if checkpoints.get(unc, 0) < size]
+        started = datetime.datetime.now()
+        results = []
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for name, rows, seconds in pool.imap_unordered(LogImporter.import_file, pending):
+                results.append([name, rows, round(seconds, 3), round(rows / seconds) if seconds else 0])
+                print(f'{name}: {rows} rows in {seconds:.3f}s')
+        seconds = (datetime.datetime.now() - started).total_seconds()
+        rows = sum([result[1] for result in results])
+        results.sort()
+        results.append(['TOTAL', rows, round(seconds, 3), round(rows / seconds) if seconds else 0])
+        print(tabulate(results, headers=['File', 'Rows', 'Seconds', 'Rows/s'], tablefmt='psql'))
+        print(f'Skipped {len(units) - len(pending)} of {len(units)} file(s) already imported')
+
+    @staticmethod
+    def import_file(unc: str) -> Tuple[str, int, float]:
+        started = datetime.datetime.now()
+        kind = LogImporter.FILE_PATTERN.match(os.path.basename(unc)).group(1)
+        connection = psycopg2.connect(db_url)
+        try:
+            _cursor = connection.cursor()
+            # Make sure the checkpoint row exists so FOR UPDATE serialises overlapping imports of a new file
+            _cursor.execute(
+                'INSERT INTO import_checkpoint (filename, position, rows) VALUES (%s, 0, 0) '
+                'ON CONFLICT (filename) DO NOTHING',
+                [unc]
+            )
+            _cursor.execute('SELECT position FROM import_checkpoint WHERE filename = %s FOR UPDATE', [unc])
+            position = _cursor.fetchone()[0]
+            progress = {'position': position, 'rows': 0}
+            with open(unc, 'rb') as f, tempfile.TemporaryFile('w+') as basic:
+                f.seek(position)
+                rows = LogImporter._rows(f, kind, progress, basic if kind == 'status' else None)
+                _cursor.copy_expert(
+                    f'COPY incoming_{kind} (unixtime, source, data) FROM STDIN', LogImporter.CopyStream(rows)
+                )
+                if kind == 'status':
+                    basic.seek(0)
+                    _cursor.copy_expert('COPY incoming_basic (unixtime, source, data) FROM STDIN', basic)
+            _cursor.execute(
+                'UPDATE import_checkpoint SET position = %s, rows = rows + %s, imported = %s WHERE filename = %s',
+                [progress['position'], progress['rows'], datetime.datetime.now().timestamp(), unc]
+            )
+            connection.commit()
+        finally:
+            connection.close()
+        return os.path.basename(unc), progress['rows'], (datetime.datetime.now() - started).total_seconds()
+
+    @staticmethod
+    def _rows(f, kind: str, progress: dict, basic=None):
+        for line in f:
+            if not line.endswith(b'\n'):
+                # Incomplete trailing line, the poller is still writing it
+                break
+            progress['position'] += len(line)
+            fields = line.decode().rstrip('\r\n').split(COLUMN_SEPARATOR)
+            if len(fields) < 3:
+                continue
+            unixtime, source = fields[0], fields[1]
+            entries = [
+                entry for entry in fields[2:]
+                if kind == 'sense' or entry.partition(':')[0] not in LogImporter.META_DATA
+            ]
+            progress['rows'] += 1
+            yield LogImporter._copy_row([unixtime, source, COLUMN_SEPARATOR.join(entries)])
+            if basic is not None:
+                buffer = []
+                for entry in entries:
+                    key, _, value = entry.partition(':')
+                    if key in BASIC_STATUS:
+                        _index, _raw, *_value, _unit = value.split(LIST_SEPARATOR)
+                        buffer.append(f'{key}:{LIST_SEPARATOR.join(_value)}{_unit}')
+                basic.write(LogImporter._copy_row([unixtime, source, COLUMN_SEPARATOR.join(buffer)]))
+
+    @staticmethod
+    def _copy_row(columns: list) -> str:
+        return '\t'.join([
+            column.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+            for column in columns
+        ]) + '\n'
+
+
+class LogReader:
+    """
+    Time range reader over the daily log files. A sparse timestamp -> byte offset index is kept
+    next to every file (<file>.idx) and rebuilt when the file size or mtime changes, so a query
+    seeks straight to the requested range instead of scanning the whole day.
+    """
+
+    INDEX_STRIDE = 256
+    INDEX_SUFFIX = '.idx'
+    # Slice of the LIST_SEPARATOR parts that holds the decoded value, per log kind
+    VALUE_SLICE = {
+        'sense': slice(0, None),
+        'status': slice(2, -1),
+        'setup': slice(2, -1),
+        'energy': slice(0, -1),
+    }
+
+    def __init__(self, path: str, kind: str):
+        self.path = path
+        self.kind = kind
+
+    def files(self, start: float, end: float) -> list:
+        day = datetime.datetime.fromtimestamp(start).date()
+        last = datetime.datetime.fromtimestamp(end).date()
+        units = []
+        while day <= last:
+            unc = os.path.join(self.path, f'{self.kind}-{day.strftime("%Y%m%d")}.log')
+            if os.path.isfile(unc):
+                units.append(unc)
+            day += datetime.timedelta(days=1)
+        return units
+
+    @staticmethod
+    def index(unc: str) -> list:
+        stat = os.stat(unc)
+        index_unc = f'{unc}{LogReader.INDEX_SUFFIX}'
+        try:
+            cached = load_state(index_unc)
+            if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime:
+                return cached['entries']
+        except (ValueError, KeyError, TypeError):
+            # Damaged index (killed or racing writer), treat it as stale and rebuild it
+            pass
+        entries = []
+        offset = 0
+        with open(unc, 'rb') as f:
+            for count, line in enumerate(f):
+                if count % LogReader.INDEX_STRIDE == 0:
+                    unixtime = LogReader._unixtime(line)
+                    if unixtime is not None:
+                        entries.append([unixtime, offset])
+                offset += len(line)
+        try:
+            save_state(index_unc, {'size': stat.st_size, 'mtime': stat.st_mtime, 'entries': entries})
+        except OSError:
+            # Read only archive, the index is simply not cached
+            pass
+        return entries
+
+    def read(self, start: float, end: float, source: str = None, fields: list = None):
+        for unc in self.files(start, end):
+            entries = LogReader.index(unc)
+            position = bisect.bisect_left([entry[0] for entry in entries], start) - 1
+            offset = entries[position][1] if position >= 0 else 0
+            with open(unc, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    unixtime = LogReader._unixtime(line)
+                    if unixtime is None or unixtime < start:
+                        continue
+                    if unixtime > end:
+                        break
+                    row = self._row(line.decode().rstrip('\r\n'), fields)
+                    if source and row['source'] != source and not row['source'].endswith(f'/{source}'):
+                        continue
+                    yield row
+
+    def _row(self, line: str, fields: list = None) -> dict:
+        columns = line.split(COLUMN_SEPARATOR)
+        row = {'unixtime': float(columns[0]), 'source': columns[1]}
+        for entry in columns[2:]:
+            key, _, value = entry.rpartition(':')
+            if fields and key not in fields:
+                continue
+            if LIST_SEPARATOR in value:
+                # Metadata entries (hex-string, Model) are plain values, not lists
+                value = LIST_SEPARATOR.join(value.split(LIST_SEPARATOR)[LogReader.VALUE_SLICE[self.kind]])
+            row[key] = value
+        return row
+
+    @staticmethod
+    def _unixtime(line: bytes) -> Optional[float]:
+        try:
+            return float(line.split(COLUMN_SEPARATOR.encode(), 1)[0])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def export(rows, columns: list, export_format: str, unc: str = None):
+        if export_format == 'csv':
+            f = open(unc, 'w', newline='') if unc else sys.stdout
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([row.get(column) for column in columns])
+            if unc:
+                f.close()
+        elif export_format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError('Parquet export requires pyarrow (pip install pyarrow)')
+            arrays = {column: [] for column in columns}
+            for row in rows:
+                for column in columns:
+                    arrays[column].append(row.get(column))
+            for column, values in arrays.items():
+                arrays[column] = LogReader._column(values)
+            pyarrow.parquet.write_table(pyarrow.table(arrays), unc)
+
+    @staticmethod
+    def _column(values: list) -> list:
+        try:
+            return [None if value is None else float(value) for value in values]
+        except ValueError:
+            return [None if value is None else f'{value}' for value in values]
+
+    @staticmethod
+    def parse_time(value: str) -> float:
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.datetime.fromisoformat(value).timestamp()
+
+    @staticmethod
+    def run():
+        start = LogReader.parse_time(args.read_from) if args.read_from else datetime.datetime.combine(
+            timestamp.date(), datetime.time()
+        ).timestamp()
+        end = LogReader.parse_time(args.read_to) if args.read_to else timestamp.timestamp()
+        fields = [field.strip() for field in args.fields.split(',')] if args.fields else None
+        reader = LogReader(args.log_path, args.read_logs)
+        rows = reader.read(start, end, args.source, fields)
+        if fields:
+            columns = ['unixtime', 'source'] + fields
+        else:
+            rows = list(rows)
+            columns = {'unixtime': None, 'source': None}
+            for row in rows:
+                columns.update(dict.fromkeys(row))
+            columns = list(columns)
+        if args.export:
+            LogReader.export(rows, columns, args.export, args.export_file)
+        else:
+            print(tabulate(
+                [[row.get(column) for column in columns] for row in rows],
+                headers=columns, tablefmt='psql', disable_numparse=True
+            ))
+
+
+class SetupApplier:
+    """
+    Pushes the setup values in a KEY="value" file (decoded units, as printed by --setup) to every
+    connected inverter. The desired registers are diffed against the setup cached from the last
+    read_setup(); only inverters that differ are read again, written from that fresh read,
+    concurrently, and then read back to verify.
+    """
+
+    UNCHANGED = 'UNCHANGED'
+    VERIFIED = 'VERIFIED'
+    MISMATCH = 'MISMATCH'
+    FAILED = 'FAILED'
+
+    @staticmethod
+    @pidfile(pidname=PID_NAME)
+    def run(unc: str):
+        desired = {}
+        for key, value in dotenv_values(unc).items():
+            if key not in EP2000.SETUP_ENCODING:
+                raise Inverters.SetupValueError(f'Unknown setup field "{key}"')
+            desired[key] = EP2000.encode_setup(key, value)
+        cache_unc = os.path.join(args.state_path, SETUP_STATE_FILE)
+        cache = load_state(cache_unc)
+        ports = Inverters.port_list()
+        results = []
+        if ports:
+            with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+                results = list(pool.map(lambda port: SetupApplier._apply(port, desired, cache), ports))
+        save_state(cache_unc, cache)
+        print(tabulate(results, headers=['Port', 'Changes', 'Result'], tablefmt='psql'))
+
+    @staticmethod
+    def _apply(port: str, desired: dict, cache: dict) -> list:
+        inverter = None
+        try:
+            if cache.get(port) is not None and not SetupApplier._changes(cache[port], desired):
+                return [port, '', SetupApplier.UNCHANGED]
+            # Build the write from a fresh read so values changed since the last --setup are not reverted
+            inverter = EP2000(port=port, baudrate=9600, timeout=3.0, write_timeout=1.0)
+            registers = EP2000.setup_registers(inverter.read_setup())
+            if registers is None:
+                cache.pop(port, None)
+                return [port, '', SetupApplier.FAILED]
+            cache[port] = registers
+            changes = SetupApplier._changes(registers, desired)
+            if not changes:
+                return [port, '', SetupApplier.UNCHANGED]
+            target = SetupApplier._target(registers, desired)
+            inverter.write_setup(target)
+            registers = EP2000.setup_registers(inverter.read_setup())
+            if registers is None:
+                cache.pop(port, None)
+                return [port, LIST_SEPARATOR.join(changes), SetupApplier.FAILED]
+            cache[port] = registers
+            result = SetupApplier.VERIFIED if registers == target else SetupApplier.MISMATCH
+            return [port, LIST_SEPARATOR.join(changes), result]
+        except (serial.SerialException, Inverters.SerialWriteException, Inverters.SerialReadException) as e:
+            cache.pop(port, None)
+            return [port, f'{e}', SetupApplier.FAILED]
+        finally:
+            if inverter is not None:
+                inverter.close()
+
+    @staticmethod
+    def _target(registers: list, desired: dict) -> list:
+        keys = list(EP2000.SETUP_ENCODING)
+        target = list(registers)
+        for key, raw in desired.items():
+            target[keys.index(key)] = raw
+        return target
+
+    @staticmethod
+    def _changes(registers: list, desired: dict) -> list:
+        target = SetupApplier._target(registers, desired)
+        return [
+            f'{key}:{registers[index]}->{target[index]}'
+            for index, key in enumerate(EP2000.SETUP_ENCODING)
+            if registers[index] != target[index]
+        ]
+
+
 @pidfile(pidname=PID_NAME)
 def main():
     # -----------------------------------------------------------------------------------------------------------------
@@ -610,6 +1420,16 @@ def main():
     inverters = [
         EP2000(port=port, baudrate=9600, timeout=3.0, write_timeout=1.0) for port in Inverters.port_list()
     ]
+    alert_rules = None
+    if args.alerts:
+        alert_rules = AlertRules(config, os.path.join(args.state_path, ALERT_STATE_FILE))
+    energy_counters = None
+    if args.energy:
+        energy_counters = EnergyCounters(os.path.join(args.state_path, ENERGY_STATE_FILE), ENERGY_MAX_GAP)
+        if args.database and db_connection:
+            _cursor = db_connection.cursor()
+            _cursor.execute(EnergyCounters.TABLE)
+            db_connection.commit()
     # -----------------------------------------------------------------------------------------------------------------
     for i in range(len(inverters)):
         inverter = inverters[i]
@@ -710,9 +1530,47 @@ def main():
                 _query = 'INSERT INTO incoming_basic (unixtime, source, data) values (%s, %s, %s)'
                 _cursor.execute(_query, buffer)
                 db_connection.commit()
+            if args.alerts and alert_rules:
+                alert_rules.evaluate(inverter.port, report, timestamp.timestamp())
+            if args.energy and energy_counters:
+                energy = energy_counters.update(inverter.port, report, timestamp.timestamp())
+                if args.print and energy:
+                    print(tabulate(
+                        [([key] + list(value)) for key, value in energy.items()],
+                        headers=['Key', 'Value', 'Unit'],
+                        tablefmt='psql'
+                    ))
+                if args.log and energy:
+                    buffer = [f'{timestamp.timestamp()}', f'{inverter.port}']
+                    buffer.extend([
+                        f'{key}:{LIST_SEPARATOR.join([f"{_item}" for _item in value])}'
+                        for key, value in energy.items()
+                    ])
+                    unc = os.path.join(args.log_path, ENERGY_LOG_FILE_MASK)
+                    with open(unc, 'a') as f:
+                        f.write(COLUMN_SEPARATOR.join(buffer))
+                        f.write(NEWLINE)
+                if args.database and db_connection and energy:
+                    buffer = [
+                        f'{timestamp.timestamp()}',
+                        f'{inverter.port}',
+                        COLUMN_SEPARATOR.join([
+                            f'{key}:{LIST_SEPARATOR.join([f"{_item}" for _item in value])}'
+                            for key, value in energy.items()
+                        ])
+                    ]
+                    _query = 'INSERT INTO incoming_energy (unixtime, source, data) values (%s, %s, %s)'
+                    _cursor = db_connection.cursor()
+                    _cursor.execute(_query, buffer)
+                    db_connection.commit()
         # -------------------------------------------------------------------------------------------------------------
         if args.setup:
             report = inverter.read_setup()
+            if os.path.isdir(args.state_path) and EP2000.setup_registers(report) is not None:
+                unc = os.path.join(args.state_path, SETUP_STATE_FILE)
+                cache = load_state(unc)
+                cache[inverter.port] = EP2000.setup_registers(report)
+                save_state(unc, cache)
             if args.print:
                 print(tabulate(
                     [([key] + list(value)) for key, value in report.items() if key != 'meta-data'],
@@ -745,11 +1603,22 @@ def main():
                 _cursor.execute(_query, buffer)
                 db_connection.commit()
     # -----------------------------------------------------------------------------------------------------------------
+    if alert_rules:
+        alert_rules.save()
+    if energy_counters:
+        energy_counters.save()
 
 
 if __name__ == '__main__':
     if args.list:
         print(Inverters.list_ports())
+    elif args.apply_setup:
+        SetupApplier.run(args.apply_setup)
+    elif args.read_logs:
+        LogReader.run()
+    elif args.import_logs:
+        LogImporter.run(args.import_logs, args.import_workers)
+        db_connection.close()
     else:
         main()
         if db_connection: